@@ -45,6 +45,37 @@ import variables
 import signals
 
 
+class _UntitledNumbers:
+    """Keeps the numbers in use by nameless documents in app.documents.
+
+    The number for a new nameless document is one higher than the highest
+    number in use, and is found without looking at all open documents.
+
+    """
+    def __init__(self):
+        self._numbers = set()
+        self._max = 0
+
+    def next(self):
+        """Return the number to use for a new nameless document."""
+        return self._max + 1
+
+    def add(self, num):
+        """Register a number as being in use. Zero is ignored."""
+        if num:
+            self._numbers.add(num)
+            self._max = max(self._max, num)
+
+    def discard(self, num):
+        """Release a number that was in use."""
+        self._numbers.discard(num)
+        while self._max and self._max not in self._numbers:
+            self._max -= 1
+
+
+_untitled_numbers = _UntitledNumbers()
+
+
 class AbstractDocument(QTextDocument):
     """Base class for a Frescobaldi document. Not intended to be instantiated.
 
@@ -52,6 +83,7 @@ class AbstractDocument(QTextDocument):
     or lilypondinfo etc. for additional meta information.
 
     """
+    _num = 0
 
     @classmethod
     def load_data(cls, url, encoding=None):
@@ -180,12 +212,7 @@ class AbstractDocument(QTextDocument):
             url = QUrl()
         old, self._url = self._url, url
         # number for nameless documents
-        if self._url.isEmpty():
-            nums = [0]
-            nums.extend(doc._num for doc in app.documents if doc is not self)
-            self._num = max(nums) + 1
-        else:
-            self._num = 0
+        self._num = _untitled_numbers.next() if self._url.isEmpty() else 0
         return old
 
     def encoding(self):
@@ -262,6 +289,7 @@ class EditorDocument(AbstractDocument):
         self.closed()
         app.documentClosed(self)
         app.documents.remove(self)
+        _untitled_numbers.discard(self._num)
 
     def load(self, url=None, encoding=None, keepUndo=False):
         super().load(url, encoding, keepUndo)
@@ -276,7 +304,9 @@ class EditorDocument(AbstractDocument):
         app.documentSaved(self)
 
     def setUrl(self, url):
+        _untitled_numbers.discard(self._num)
         old = super().setUrl(url)
+        _untitled_numbers.add(self._num)
         if url != old:
             self.urlChanged(url, old)
             app.documentUrlChanged(self, url, old)
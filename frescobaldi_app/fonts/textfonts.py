@@ -17,23 +17,29 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 # See http://www.gnu.org/licenses/ for more information.
 
+import hashlib
 import os
 import re
+import tempfile
 
 from PyQt5.QtCore import (
     QObject,
     QRegExp,
     QSettings,
     QSortFilterProxyModel,
+    QStandardPaths,
     Qt,
+    QTimer,
 )
 from PyQt5.QtWidgets import (
     QAbstractItemView,
     QAction,
     QApplication,
+    QHBoxLayout,
     QLabel,
     QLineEdit,
     QMenu,
+    QPushButton,
     QTreeView,
     QVBoxLayout,
     QWidget,
@@ -53,6 +59,54 @@ import signals
 # List of notation fonts currently installed.
 _installed_notation_fonts = []
 
+# Entries of interest in the output of `lilypond -dshow-available-fonts`.
+# NOTE: output of this process is always English.
+_entry_re = re.compile(r'(family|Config files:|Font dir:|Config dir:) (.*)')
+
+# Size-indexed font families
+_size_indexed_re = re.compile(r'(.*)\\-\d+')
+
+# The list of styles in the second line of a font entry starts with this
+_style_prefix = 'style='
+_style_prefix_len = len(_style_prefix)
+
+
+def _utf8(text):
+    """Return text from the LilyPond output decoded as UTF-8.
+
+    The job decodes the output as latin1, which is cheap, can't fail and
+    keeps the original bytes. Only the parts of the output that are kept
+    are decoded as UTF-8, which is what fontconfig uses for names and paths.
+
+    """
+    return text.encode('latin1').decode('utf-8', 'replace')
+
+
+def _paths_stamp(log):
+    """Return the modification times of the fontconfig paths in the log.
+
+    Every configuration file, configuration directory and font directory
+    listed in the log gives its modification time in nanoseconds, or '-'
+    if it doesn't exist. The stamp is stored with the cache and changes
+    whenever fonts or the fontconfig configuration change.
+
+    The paths are taken from the original bytes of the output, so also
+    paths that are not valid UTF-8 can be checked. Returns None if none
+    of the paths exists, because such a stamp could never change.
+
+    """
+    stamp = []
+    for e in log:
+        m = _entry_re.match(e)
+        if m and m.group(1) != 'family':
+            path = os.fsdecode(m.group(2).encode('latin1'))
+            try:
+                stamp.append(str(os.stat(path).st_mtime_ns))
+            except OSError:
+                stamp.append('-')
+    if any(s != '-' for s in stamp):
+        return ' '.join(stamp)
+
 
 class TextFontsWidget(QWidget):
     """Display installed text fonts available for a given LilyPond version."""
@@ -66,6 +120,7 @@ class TextFontsWidget(QWidget):
         self.fonts = available_fonts.text_fonts()
 
         self.status_label = QLabel(wordWrap=True)
+        self.refresh_button = QPushButton(clicked=self.refresh)
         self.tree_view = tv = QTreeView()
         self.filter_edit = QLineEdit(clearButtonEnabled=True)
         tv.setEditTriggers(QAbstractItemView.NoEditTriggers)
@@ -73,13 +128,20 @@ class TextFontsWidget(QWidget):
         tv.customContextMenuRequested.connect(self.show_context_menu)
 
         layout = QVBoxLayout(self)
-        layout.addWidget(self.status_label)
+        top = QHBoxLayout()
+        top.addWidget(self.status_label, 1)
+        top.addWidget(self.refresh_button)
+        layout.addLayout(top)
         layout.addWidget(self.tree_view)
         layout.addWidget(self.filter_edit)
         self.setLayout(layout)
 
         self.tree_view.setModel(self.fonts.model().proxy())
-        self.filter_edit.textChanged.connect(self.update_filter)
+        # Filter only after typing pauses, not after every keystroke
+        self._filter_timer = QTimer(
+            singleShot=True, interval=150, timeout=self.update_filter)
+        self.filter_edit.textChanged.connect(
+            lambda: self._filter_timer.start())
         self.loadSettings()
         dialog.finished.connect(self.saveSettings)
         app.translateUI(self)
@@ -91,6 +153,9 @@ class TextFontsWidget(QWidget):
             self.fonts.loaded.connect(self.populate)
 
     def translateUI(self):
+        self.refresh_button.setText(_("&Refresh"))
+        self.refresh_button.setToolTip(_(
+            "Run LilyPond again to list the available fonts."))
         self.filter_edit.setPlaceholderText(_(
             "Filter results (type any part of the font family name. "
             "Regular Expressions supported.)"
@@ -115,6 +180,7 @@ class TextFontsWidget(QWidget):
                 version=self.lilypond_info.prettyName()))
 
     def display_waiting(self):
+        self.refresh_button.setEnabled(False)
         self.status_label.setText(_("Running LilyPond to list fonts ..."))
 
     def load_font_tree_column_width(self):
@@ -125,12 +191,20 @@ class TextFontsWidget(QWidget):
         self.tree_view.setColumnWidth(0, int(s.value('col-width', 200)))
 
     def populate(self):
+        self.refresh_button.setEnabled(True)
         self.load_font_tree_column_width()
         self.display_count()
         self.refresh_filter_edit()
         self.filter_edit.setFocus()
         QApplication.restoreOverrideCursor()
 
+    def refresh(self):
+        """Run LilyPond again to list the fonts, bypassing the cache."""
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        self.display_waiting()
+        self.fonts.loaded.connect(self.populate)
+        self.fonts.load_fonts(use_cache=False)
+
     def refresh_filter_edit(self):
         self.filter_edit.setText(TextFontsWidget.filter_re)
 
@@ -214,7 +288,7 @@ class FontFilterProxyModel(QSortFilterProxyModel):
             return True
         else:
             index = self.sourceModel().index(row, 0, parent)
-            if index.data().lower() in _installed_notation_fonts:
+            if index.data(FontTreeModel.SearchRole) in _installed_notation_fonts:
                 return False
             else:
                 return super().filterAcceptsRow(row, parent)
@@ -224,11 +298,18 @@ class FontTreeModel(QStandardItemModel):
     """Custom Item Model holding information about available
     fonts. Builds the tree upon first use and caches the results
     until invalidated.
-    Uses a custom filter mechanism to never filter child elements."""
+    Uses a custom filter mechanism to never filter child elements.
+    Top-level items store their lowercased name in SearchRole, which the
+    proxy filters on, so the names are lowercased once when populating
+    instead of for every row on every filter change."""
+
+    SearchRole = Qt.UserRole
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self._proxy = FontFilterProxyModel(self)
         self._proxy.setSourceModel(self)
+        self._proxy.setFilterRole(self.SearchRole)
 
     def populate(self, families):
         """Populate the data model to be displayed in the results"""
@@ -248,8 +329,10 @@ class FontTreeModel(QStandardItemModel):
             return item
 
         self.reset()
-        family_names = sorted(families.keys(), key=lambda s: s.lower())
-        root = self.invisibleRootItem()
+        family_names = sorted(families.keys(), key=str.lower)
+        # Build the complete family items first and add them at once
+        # so the proxy model and views see one insertion for all fonts.
+        items = []
         for name in family_names:
             family = families[name]
             sub_families = []
@@ -278,12 +361,15 @@ class FontTreeModel(QStandardItemModel):
             if (len(sub_families) == 1
                 and isinstance(sub_families[0], QStandardItem)
             ):
-                root.appendRow(sub_families[0])
+                items.append(sub_families[0])
             else:
                 family_item = QStandardItem(name)
-                root.appendRow(family_item)
                 for f in sub_families:
                     family_item.appendRow(f)
+                items.append(family_item)
+        for item in items:
+            item.setData(item.text().lower(), self.SearchRole)
+        self.invisibleRootItem().appendRows(items)
 
     def proxy(self):
         return self._proxy
@@ -307,11 +393,11 @@ class MiscTreeModel(QStandardItemModel):
     def populate(self, config_files, config_dirs, font_dirs):
         """Sort entries and construct the overall model."""
         self.reset()
-        for file in sorted(config_files, key=lambda s: s.lower()):
+        for file in sorted(config_files, key=str.lower):
             self.config_files.appendRow(QStandardItem(file))
-        for config_dir in sorted(config_dirs, key=lambda s: s.lower()):
+        for config_dir in sorted(config_dirs, key=str.lower):
             self.config_dirs.appendRow(QStandardItem(config_dir))
-        for font_dir in sorted(font_dirs, key=lambda s: s.lower()):
+        for font_dir in sorted(font_dirs, key=str.lower):
             self.font_dirs.appendRow(QStandardItem(font_dir))
 
         misc_root = self.invisibleRootItem()
@@ -330,7 +416,8 @@ class TextFonts(QObject):
     """Provide information about available text fonts. These are exactly the
     fonts that can be seen by LilyPond.
     This is only produced upon request but then stored permanently during the
-    program's runtime.
+    program's runtime. The LilyPond output is also cached on disk, so later
+    sessions don't have to run LilyPond again (see read_cache()).
     load_fonts() will run LilyPond to determine the list of fonts, optionally
     reporting to a log.Log widget if given.
     Since this is an asynchronous process GUI elements that want to use the
@@ -420,7 +507,10 @@ class TextFonts(QObject):
             if not sub_family in family.keys():
                 family[sub_family] = []
             qt_styles = self.font_db.styles(sub_family)
-            lily_styles = input[1][6:].split(',')
+            styles = input[1]
+            if styles.startswith(_style_prefix):
+                styles = styles[_style_prefix_len:]
+            lily_styles = styles.split(',')
             match = ''
             if not qt_styles:
                 # In some cases Qt does *not* report available styles.
@@ -456,29 +546,55 @@ class TextFonts(QObject):
             #print(name)
             #print(input)
 
+    def cache_filename(self):
+        """Return the filename to cache the LilyPond output in.
+
+        The name depends on the path and modification time of the LilyPond
+        executable, so a changed LilyPond installation gets a new cache file.
+        Returns None if the executable can't be found.
+
+        """
+        command = self.lilypond_info.abscommand()
+        if not command:
+            return
+        try:
+            mtime = os.path.getmtime(command)
+        except OSError:
+            return
+        key = hashlib.sha1(f'{command}\n{mtime}'.encode('utf-8')).hexdigest()
+        return os.path.join(
+            QStandardPaths.writableLocation(QStandardPaths.CacheLocation),
+            'available-fonts', key + '.txt')
+
     def flatten_log(self):
-        """Flatten job history into flat string list."""
-        for line in self.job.history():
-            # lines in Job.history() are tuples of text and type,
-            # we're only interested in the text.
-            lines = line[0].split('\n')
-            for l in lines:
-                self._log.append(l)
+        """Flatten job output into a list of lines."""
+        # Lines in Job.history() are tuples of text and type, and a line of
+        # output may be spread over several of them, so join the text first.
+        # LilyPond writes CRLF line endings on Windows, strip the '\r' too.
+        output = ''.join(text for text, type in self.job.history(job.OUTPUT))
+        self._log = [line.rstrip('\r') for line in output.split('\n')]
 
     def is_loaded(self):
         return self._is_loaded
 
-    def load_fonts(self, log_widget=None):
+    def load_fonts(self, log_widget=None, use_cache=True):
         """Run LilyPond to retrieve a list of available fonts.
         Afterwards process_results() will parse the output and build
         info structures to be used later.
         If a log.Log widget is passed as second argument this will
         be connected to the Job to provide realtime feedback on the process.
         Any caller should connect to the 'loaded' signal because this
-        is an asynchronous task that takes long to complete."""
+        is an asynchronous task that takes long to complete.
+        If use_cache is True and the output of an earlier run of the same
+        LilyPond executable is cached, the fonts are loaded immediately
+        from the cache. use_cache=False always runs LilyPond, and so
+        refreshes the cache."""
         self.reset()
         self.acknowledge_lily_fonts()
-        self.run_lilypond(log_widget)
+        if use_cache and self.read_cache():
+            self.populate()
+        else:
+            self.run_lilypond(log_widget)
 
     def misc_model(self):
         return self._misc_model
@@ -490,55 +606,116 @@ class TextFonts(QObject):
         """Parse the LilyPond log and push entries to the various
         lists and dictionaries. Parsing the actual font style
         definition is deferred to add_style_to_family()."""
-        regexp = re.compile(r'(.*)\\-\d+')
         families = {}
         config_files = []
         config_dirs = []
         font_dirs = []
+        entries = {
+            'Config files:': config_files,
+            'Font dir:': font_dirs,
+            'Config dir:': config_dirs,
+        }
         last_family = None
         for e in self._log:
-            if e.startswith('family'):
-                # NOTE: output of this process is always English,
-                # so we can hardcode the splice indices
-                original_family = e[7:]
+            m = _entry_re.match(e)
+            if m and m.group(1) == 'family':
+                original_family = _utf8(m.group(2))
                 # filter size-indexed font families
-                basename = regexp.match(original_family)
-                last_family = basename.groups()[0] if basename else original_family
+                basename = _size_indexed_re.match(original_family)
+                last_family = basename.group(1) if basename else original_family
             elif last_family:
                 # We're in the second line of a style definition
                 if not last_family.endswith('-brace'):
-                    self.add_style_to_family(families, last_family, e)
+                    self.add_style_to_family(families, last_family, _utf8(e))
                 last_family = None
-            elif e.startswith('Config files:'):
-                config_files.append(e[14:])
-            elif e.startswith('Font dir:'):
-                font_dirs.append(e[10:])
-            elif e.startswith('Config dir:'):
-                config_dirs.append(e[12:])
+            elif m:
+                entries[m.group(1)].append(_utf8(m.group(2)))
 
         return families, config_files, config_dirs, font_dirs
 
-    def process_results(self):
-        """Parse the job history list to dictionaries."""
-
-        self.flatten_log()
+    def populate(self):
+        """Parse the log and populate the models."""
         families, config_files, config_dirs, font_dirs = self.parse_entries()
 
         self._tree_model.populate(families)
         self._misc_model.populate(config_files, config_dirs, font_dirs)
 
         self._is_loaded = True
-        self.job = None
         self.loaded.emit()
 
+    def process_results(self):
+        """Parse the job history list to dictionaries."""
+        self.flatten_log()
+        if self.job.success:
+            self.write_cache()
+        self.job = None
+        self.populate()
+
+    def read_cache(self):
+        """Read the log from the cache. Return True if that succeeded.
+
+        The cache is not used if any of the configuration files or
+        directories or font directories it lists has changed, appeared or
+        disappeared since the cache was written, or if none of them can be
+        found, see _paths_stamp().
+
+        """
+        filename = self.cache_filename()
+        if not filename:
+            return False
+        try:
+            with open(filename, 'rb') as f:
+                stamp = f.readline().decode('latin1').rstrip('\n')
+                log = f.read().decode('latin1').split('\n')
+        except OSError:
+            return False
+        current = _paths_stamp(log)
+        if current is None or stamp != current:
+            return False
+        self._log = log
+        return True
+
     def run_lilypond(self, log_widget=None):
         """Run lilypond from info with the args list, and a job title."""
         # TODO: Use the global JobQueue
         info = self.lilypond_info
+        # The output is decoded as latin1, see _utf8() and write_cache()
         j = self.job = job.Job(
-            [info.abscommand() or info.command] + ['-dshow-available-fonts'])
+            [info.abscommand() or info.command] + ['-dshow-available-fonts'],
+            encoding='latin1')
         j.set_title(_("Available Fonts"))
         j.done.connect(self.process_results)
         if log_widget:
             log_widget.connectJob(j)
         j.start()
+
+    def write_cache(self):
+        """Write the log to the cache, see read_cache().
+
+        The first line of the cache file is the stamp of the fontconfig
+        paths, followed by the output of LilyPond as it was, i.e. the log is
+        encoded back to the bytes the job decoded as latin1. The file is
+        written under a temporary name and then renamed, so an interrupted
+        write never leaves a truncated cache behind.
+
+        """
+        filename = self.cache_filename()
+        stamp = _paths_stamp(self._log)
+        if not filename or stamp is None:
+            return
+        directory = os.path.dirname(filename)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=directory)
+        except OSError:
+            return
+        try:
+            with open(fd, 'wb') as f:
+                f.write(stamp.encode('latin1') + b'\n')
+                f.write('\n'.join(self._log).encode('latin1'))
+            os.replace(temp, filename)
+        except OSError:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
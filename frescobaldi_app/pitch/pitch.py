@@ -98,12 +98,13 @@ def getTransposer(document, mainwindow):
 
     """
     language = documentinfo.docinfo(document).language() or 'nederlands'
+    reader = ly.pitch.pitchReader(language)
 
     def readpitches(text):
         """Reads pitches from text."""
         result = []
         for pitch, octave in re.findall(r"([a-z]+)([,']*)", text):
-            r = ly.pitch.pitchReader(language)(pitch)
+            r = reader(pitch)
             if r:
                 result.append(ly.pitch.Pitch(*r, octave=ly.pitch.octaveToNum(octave)))
         return result
@@ -129,12 +130,13 @@ def getModalTransposer(document, mainwindow):
 
     """
     language = documentinfo.docinfo(document).language() or 'nederlands'
+    reader = ly.pitch.pitchReader(language)
 
     def readpitches(text):
         """Reads pitches from text."""
         result = []
         for pitch, octave in re.findall(r"([a-z]+)([,']*)", text):
-            r = ly.pitch.pitchReader(language)(pitch)
+            r = reader(pitch)
             if r:
                 result.append(ly.pitch.Pitch(*r, octave=ly.pitch.octaveToNum(octave)))
         return result
@@ -167,12 +169,13 @@ def getModeShifter(document, mainwindow):
 
     """
     language = documentinfo.docinfo(document).language() or 'nederlands'
+    reader = ly.pitch.pitchReader(language)
 
     def readpitches(text):
         """Reads pitches from text."""
         result = []
         for pitch, octave in re.findall(r"([a-z]+)([,']*)", text.lower()):
-            r = ly.pitch.pitchReader(language)(pitch)
+            r = reader(pitch)
             if r:
                 result.append(ly.pitch.Pitch(*r, octave=ly.pitch.octaveToNum(octave)))
         return result
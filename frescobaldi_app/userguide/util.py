@@ -22,6 +22,7 @@ Utility functions for the user guide.
 """
 
 
+import functools
 import re
 
 import app
@@ -114,10 +115,13 @@ def format_link(name):
     title = simplemarkdown.html_escape(cache.title(name))
     return f'<a href="{name}">{title}</a>'
 
+_external_link_re = re.compile(
+    r'''<a\s+.*?href\s*=\s*(['"])(ht|f)tps?.*?\1[^>]*>''', re.I)
+
+@functools.lru_cache(maxsize=128)
 def markexternal(text):
     """Marks http(s)/ftp(s) links as external with an arrow."""
-    pat = re.compile(r'''<a\s+.*?href\s*=\s*(['"])(ht|f)tps?.*?\1[^>]*>''', re.I)
-    return pat.sub(r'\g<0>&#11008;', text)
+    return _external_link_re.sub(r'\g<0>&#11008;', text)
 
 
 _userguide_html_template = '''\
@@ -253,15 +253,14 @@ def decode(data, encoding=None):
                 return data.decode(e)
             except (UnicodeError, LookupError):
                 pass
-    latin1 = data.decode('latin1') # this never fails
-    encoding = variables.variables(latin1).get("coding")
+    encoding = variables.variables(variables.head_and_tail(data)).get("coding")
     for e in (encoding, 'utf-8'):
         if e and e != 'latin1':
             try:
                 return data.decode(e)
             except (UnicodeError, LookupError):
                 pass
-    return latin1
+    return data.decode('latin1') # this never fails
 
 
 def encode(text, encoding=None, default_encoding='utf-8'):
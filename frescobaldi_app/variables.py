@@ -78,6 +78,24 @@ def variables(text):
     return d
 
 
+def head_and_tail(data):
+    """Returns the part of the bytes data variables() looks at, as latin1 text.
+
+    For large data only the first and last lines are decoded, so finding
+    e.g. the 'coding' variable does not need a decoded copy of all the data.
+
+    """
+    if data.count(b'\n') > 2 * _LINES + 1:
+        head = 0
+        for i in range(_LINES):
+            head = data.index(b'\n', head) + 1
+        tail = len(data)
+        for i in range(_LINES + 2):
+            tail = data.rindex(b'\n', 0, tail)
+        data = data[:head] + data[tail+1:]
+    return data.decode('latin1')
+
+
 class VariableManager(plugin.DocumentPlugin):
     """Caches variables in the document and monitors for changes.
 